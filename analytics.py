@@ -0,0 +1,220 @@
+import array
+import datetime
+import multiprocessing
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Historical analytics (monthly revenue, weekly visits, retention cohorts).
+# Only the needed columns are read, in chunks, into typed arrays; the heavy
+# part runs in a process pool so web workers never do it, and results are
+# cached per (date range, filters).
+
+CHUNK_SIZE = 10000
+MAX_WORKERS = 2
+CACHE_TTL_SECONDS = 10 * 60
+# A job still running after this is treated as hung and dropped
+PENDING_TIMEOUT_SECONDS = 5 * 60
+MAX_CACHE_ENTRIES = 64
+
+# julianday('0001-01-01') is 1721425.5; date.toordinal() of that day is 1
+_ORDINAL_OFFSET = 1721424.5
+
+_executor = None
+_executor_lock = threading.Lock()
+_cache = {}
+_cache_lock = threading.Lock()
+
+def _month_key(column):
+    return f"(CAST(strftime('%Y', {column}) AS INTEGER) * 12 + CAST(strftime('%m', {column}) AS INTEGER) - 1)"
+
+def _ordinal(column):
+    return f"CAST(julianday(date({column})) - {_ORDINAL_OFFSET} AS INTEGER)"
+
+def _month_label(key):
+    return f"{key // 12:04d}-{key % 12 + 1:02d}"
+
+def _load_columns(conn, sql, params, typecodes):
+    columns = [array.array(t) for t in typecodes]
+    cursor = conn.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(CHUNK_SIZE)
+        if not rows:
+            break
+        for column, values in zip(columns, zip(*rows)):
+            column.extend(values)
+    return columns
+
+def _monthly_revenue(conn, date_from, date_to, type_id):
+    sql = f"""SELECT {_month_key('s.start_date')}, t.price
+              FROM active_subscriptions s JOIN subscription_types t ON t.id = s.type_id
+              WHERE s.start_date >= ? AND s.start_date <= ?"""
+    params = [date_from.isoformat(), date_to.isoformat()]
+    if type_id:
+        sql += " AND s.type_id = ?"
+        params.append(type_id)
+    months, prices = _load_columns(conn, sql, params, 'ld')
+
+    sub_revenue = Counter()
+    new_subscriptions = Counter(months)
+    for month, price in zip(months, prices):
+        sub_revenue[month] += price
+
+    class_revenue = Counter()
+    # Class fees are not tied to a subscription type
+    if not type_id:
+        end = (date_to + datetime.timedelta(days=1)).isoformat()
+        months, prices = _load_columns(conn, f"""
+            SELECT {_month_key('p.enrolled_at')}, COALESCE(c.price, 0)
+            FROM class_participants p JOIN class_schedules c ON c.id = p.class_id
+            WHERE p.enrolled_at >= ? AND p.enrolled_at < ?""", [date_from.isoformat(), end], 'ld')
+        for month, price in zip(months, prices):
+            class_revenue[month] += price
+
+    first = date_from.year * 12 + date_from.month - 1
+    last = date_to.year * 12 + date_to.month - 1
+    return [{
+        'month': _month_label(m),
+        'new_subscriptions': new_subscriptions[m],
+        'subscription_revenue': round(sub_revenue[m], 2),
+        'class_revenue': round(class_revenue[m], 2),
+        'total_revenue': round(sub_revenue[m] + class_revenue[m], 2),
+    } for m in range(first, last + 1)]
+
+def _weekly_visits(conn, date_from, date_to, type_id):
+    sql = f"""SELECT {_ordinal('l.timestamp')}, l.user_id FROM access_logs l
+              WHERE l.allowed = 1 AND l.timestamp >= ? AND l.timestamp < ?"""
+    params = [date_from.isoformat(), (date_to + datetime.timedelta(days=1)).isoformat()]
+    if type_id:
+        sql += " AND EXISTS (SELECT 1 FROM active_subscriptions s WHERE s.user_id = l.user_id AND s.type_id = ?)"
+        params.append(type_id)
+    days, users = _load_columns(conn, sql, params, 'll')
+
+    visits = Counter()
+    members = {}
+    for day, user_id in zip(days, users):
+        week = day - (day - 1) % 7  # ordinal of that week's Monday
+        visits[week] += 1
+        members.setdefault(week, set()).add(user_id)
+
+    weeks = []
+    for week in sorted(visits):
+        count = len(members[week])
+        weeks.append({
+            'week': datetime.date.fromordinal(week).isoformat(),
+            'visits': visits[week],
+            'members': count,
+            'visits_per_member': round(visits[week] / count, 2),
+        })
+    return weeks
+
+def _retention_cohorts(conn, date_from, date_to, type_id):
+    # Cohort = month of a member's first subscription; retention = share of
+    # the cohort with a subscription covering each following month.
+    sql = f"SELECT user_id, {_month_key('start_date')}, {_month_key('end_date')} FROM active_subscriptions"
+    params = []
+    if type_id:
+        sql += " WHERE type_id = ?"
+        params.append(type_id)
+    users, starts, ends = _load_columns(conn, sql, params, 'lll')
+
+    first_month = {}
+    covered = set()
+    for user_id, start, end in zip(users, starts, ends):
+        if start < first_month.get(user_id, start + 1):
+            first_month[user_id] = start
+        for month in range(start, end + 1):
+            covered.add((user_id, month))
+
+    first = date_from.year * 12 + date_from.month - 1
+    last = date_to.year * 12 + date_to.month - 1
+    cohorts = {}
+    for user_id, month in first_month.items():
+        if first <= month <= last:
+            cohorts.setdefault(month, []).append(user_id)
+
+    result = []
+    for month in sorted(cohorts):
+        members = cohorts[month]
+        retention = []
+        for offset in range(last - month + 1):
+            active = sum(1 for user_id in members if (user_id, month + offset) in covered)
+            retention.append(round(active / len(members) * 100))
+        result.append({'cohort': _month_label(month), 'size': len(members), 'retention': retention})
+    return result
+
+def compute_analytics(db_path, date_from, date_to, type_id=None):
+    # Runs in a worker process: plain sqlite3, no Flask app or session
+    conn = sqlite3.connect(db_path, timeout=5)
+    try:
+        conn.execute('PRAGMA query_only = ON')
+        return {
+            'months': _monthly_revenue(conn, date_from, date_to, type_id),
+            'weeks': _weekly_visits(conn, date_from, date_to, type_id),
+            'cohorts': _retention_cohorts(conn, date_from, date_to, type_id),
+            'computed_at': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+    finally:
+        conn.close()
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            frozen = getattr(sys, 'frozen', False)
+            if not frozen and 'forkserver' in multiprocessing.get_all_start_methods():
+                # Not fork: web workers run the scheduler, purge and request
+                # threads, and a fork could copy a lock one of them holds.
+                # The fork server is started clean and only preloads this module
+                # and the main module (app.py skips its startup work there).
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload(['__main__', 'analytics'])
+                _executor = ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=context)
+            else:
+                # Frozen desktop builds (PyInstaller, Windows and macOS) and
+                # platforms without forkserver: a child would re-run app.py
+                _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+        return _executor
+
+def _reset_executor():
+    # Abandons the current pool (a hung worker is left to exit on its own)
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+def get_analytics(db_path, date_from, date_to, type_id=None):
+    # Returns ('done', result), ('pending', None) or ('error', message)
+    key = (date_from, date_to, type_id)
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            submitted, future = entry
+            if not future.done():
+                if time.monotonic() - submitted <= PENDING_TIMEOUT_SECONDS:
+                    return 'pending', None
+                del _cache[key]
+                _reset_executor()
+                return 'error', 'Analytics computation timed out'
+            if time.monotonic() - submitted <= CACHE_TTL_SECONDS:
+                try:
+                    return 'done', future.result()
+                except Exception as e:
+                    del _cache[key]
+                    return 'error', str(e)
+
+        if len(_cache) >= MAX_CACHE_ENTRIES:
+            oldest = min(_cache, key=lambda k: _cache[k][0])
+            del _cache[oldest]
+        try:
+            future = _get_executor().submit(compute_analytics, db_path, date_from, date_to, type_id)
+        except Exception as e:
+            # e.g. a worker process died; start a fresh pool next time
+            _reset_executor()
+            return 'error', str(e)
+        _cache[key] = (time.monotonic(), future)
+        return 'pending', None
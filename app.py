@@ -1,6 +1,12 @@
 from flask import Flask, render_template, request, jsonify, redirect, url_for, session
 from flask_babel import Babel, _
 import database
+import fragments
+import http_cache
+import jobs
+import analytics
+import backup
+import traffic
 import datetime
 import os
 import sys
@@ -22,17 +28,30 @@ app.config['BABEL_TRANSLATION_DIRECTORIES'] = os.path.join(base_dir, 'translatio
 db_path = os.path.join(db_dir, 'access_control.db')
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_path
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Small dedicated writer pool; dashboards and reports use database.read_session
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_size': 2, 'max_overflow': 2}
 app.config['SECRET_KEY'] = 'your-secret-key-here'  # Required for sessions
 app.config['BABEL_DEFAULT_LOCALE'] = 'en'
+# Online snapshots (see backup.py), kept next to the database
+app.config['BACKUP_DIR'] = os.path.join(db_dir, 'backups')
 
 def get_locale():
     return session.get('lang', 'en')
 
 babel = Babel(app, locale_selector=get_locale)
+fragments.init_fragments(app)
+http_cache.init_http_cache(app)
 
 # Initialize DB
 database.db.init_app(app)
-database.init_db(app)
+# The analytics fork server imports this file as __mp_main__ when it is the
+# entry script (python app.py); it must not open the DB or start the jobs
+if __name__ != '__mp_main__':
+    database.init_db(app)
+    jobs.start_background_jobs(app)
+
+# Record request sequences for replay.py (off unless ACCESS_CONTROL_CAPTURE is set)
+traffic.init_capture(app, os.environ.get('ACCESS_CONTROL_CAPTURE'))
 
 @app.route('/setlang/<lang_code>')
 def setlang(lang_code):
@@ -56,17 +75,12 @@ def scan_rfid():
     if not user:
         return jsonify({'status': 'unknown', 'rfid_tag': rfid_tag, 'message': 'User not found'}), 200 # 200 OK because it's a valid scan, just unknown user
     
-    allowed, message, status_code, sub_name, weekly_count = database.check_access(user['id'])
+    allowed, message, status_code, sub_name, weekly_count, last_log = database.check_and_log_access(user['id'])
     
     # Check_access counts *previous* logs. If we are allowing access *now*, 
     # we should include the current scan in the count for UI feedback.
     display_count = weekly_count + 1 if allowed else weekly_count
     
-    # Fetch the previously recorded attempt before saving this new one
-    last_log = database.get_last_log(user['id'])
-    
-    database.log_access(user['id'], allowed, message)
-    
     return jsonify({
         'status': status_code,
         'user_name': user['name'],
@@ -103,7 +117,7 @@ def register():
              return render_template('register.html', error="Error creating user (Phone might use used).")
 
     # Get subscription types and classes for dropdowns
-    sub_types = database.SubscriptionType.query.all()
+    sub_types = database.get_subscription_types()
     classes = database.get_all_classes()
     
     rfid_prefill = request.args.get('rfid', '')
@@ -111,6 +125,7 @@ def register():
     return render_template('register.html', sub_types=sub_types, classes=classes, rfid_prefill=rfid_prefill)
 
 @app.route('/users')
+@http_cache.conditional('users', 'subscription_types', 'class_schedules')
 def get_users_route():
     page = request.args.get('page', 1, type=int)
     name = request.args.get('name', '')
@@ -119,11 +134,16 @@ def get_users_route():
     class_id = request.args.get('class_id', '')
     
     paginated_data = database.get_users_paginated(page=page, per_page=50, search_name=name, search_phone=phone, search_sub_id=sub_id, search_class_id=class_id)
-    subscription_types = database.SubscriptionType.query.all()
-    classes = database.ClassSchedule.query.all()
+    subscription_types = database.get_subscription_types()
+    classes = database.get_all_classes()
+
+    # Rows show today's subscription state and type/class names
+    versions = database.get_cache_versions()
+    row_key = (datetime.date.today(), versions.get('subscription_types'), versions.get('class_schedules'))
     
     return render_template('users.html', 
                           paginated_data=paginated_data, 
+                          row_key=row_key,
                           subscription_types=subscription_types,
                           classes=classes,
                           search_name=name,
@@ -132,6 +152,7 @@ def get_users_route():
                           search_class_id=class_id)
 
 @app.route('/user/<int:user_id>')
+@http_cache.conditional('users', 'access_logs', 'subscription_types', 'class_schedules')
 def user_profile(user_id):
     user = database.get_user_by_id(user_id)
     if not user:
@@ -141,17 +162,7 @@ def user_profile(user_id):
     stats = database.get_user_stats(user_id)
     logs = database.get_user_logs(user_id, limit=50)
     
-    # Also fetch enrolled classes manually here for display
-    user_classes = database.db.session.query(database.ClassSchedule, database.ClassParticipant.end_date)\
-        .join(database.ClassParticipant, database.ClassParticipant.class_id == database.ClassSchedule.id)\
-        .filter(database.ClassParticipant.user_id == user_id)\
-        .all()
-    
-    classes = []
-    for c, c_end in user_classes:
-        cdict = database.dict_helper(c)
-        cdict['end_date'] = c_end.strftime('%Y-%m-%d') if c_end else None
-        classes.append(cdict)
+    classes = database.get_user_classes(user_id)
     
     return render_template('user_profile.html', user=user, sub=sub, stats=stats, logs=logs, classes=classes)
 
@@ -174,7 +185,8 @@ def edit_user(user_id):
 
 @app.route('/user/<int:user_id>/delete', methods=['POST'])
 def delete_user(user_id):
-    database.delete_user(user_id)
+    if database.delete_user(user_id):
+        jobs.wake_purge_worker()
     return redirect(url_for('get_users_route'))
 
 @app.route('/log/<int:log_id>/delete', methods=['POST'])
@@ -184,33 +196,46 @@ def delete_user_log(log_id):
     return redirect(request.referrer or url_for('admin'))
 
 @app.route('/admin')
+@http_cache.conditional('users', 'access_logs', 'subscription_types', 'class_schedules', 'purge_jobs')
 def admin():
-    logs_data = database.db.session.query(database.AccessLog, database.User.name)\
-        .join(database.User, database.AccessLog.user_id == database.User.id)\
-        .order_by(database.AccessLog.timestamp.desc())\
-        .limit(50).all()
-        
-    logs = []
-    for log, name in logs_data:
-        l_dict = database.dict_helper(log)
-        l_dict['name'] = name
-        # Convert timestamp to string for Jinja
-        if hasattr(l_dict['timestamp'], 'strftime'):
-            l_dict['timestamp'] = l_dict['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
-        logs.append(l_dict)
-
-    subscription_types = database.SubscriptionType.query.all()
+    logs = database.get_recent_logs(limit=50)
+
+    subscription_types = database.get_subscription_types()
     classes = database.get_all_classes()
     sub_stats = database.get_subscription_stats()
     class_stats = database.get_class_stats()
+    purge_jobs = database.get_purge_jobs(limit=5)
         
-    return render_template('admin.html', logs=logs, subscription_types=subscription_types, classes=classes, sub_stats=sub_stats, class_stats=class_stats)
+    return render_template('admin.html', logs=logs, subscription_types=subscription_types, classes=classes, sub_stats=sub_stats, class_stats=class_stats, purge_jobs=purge_jobs)
 
 @app.route('/admin/log/<int:log_id>/delete', methods=['POST'])
 def delete_log(log_id):
     database.delete_log(log_id)
     return redirect(url_for('admin'))
 
+@app.route('/admin/logs/delete_range', methods=['POST'])
+def delete_logs_range():
+    try:
+        date_from = datetime.date.fromisoformat(request.form.get('date_from', ''))
+        date_to = datetime.date.fromisoformat(request.form.get('date_to', ''))
+    except ValueError:
+        return redirect(url_for('admin'))
+    if database.delete_logs_between(date_from, date_to):
+        jobs.wake_purge_worker()
+    return redirect(url_for('admin'))
+
+@app.route('/api/backups')
+def api_backups():
+    snapshots = backup.list_snapshots(app.config['BACKUP_DIR'])
+    for snapshot in snapshots:
+        del snapshot['path']
+    return jsonify(snapshots)
+
+@app.route('/api/purge_jobs')
+@http_cache.conditional('purge_jobs')
+def api_purge_jobs():
+    return jsonify(database.get_purge_jobs())
+
 @app.route('/admin/subscription_types', methods=['POST'])
 def create_subscription_type():
     name = request.form.get('name')
@@ -268,10 +293,93 @@ def edit_class_schedule(class_id):
 #     app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False)
 
 @app.route('/reports')
+@http_cache.conditional('users', 'subscription_types', 'class_schedules')
 def reports():
     stats = database.get_report_stats()
     return render_template('reports.html', **stats)
 
+# Upper bound for ?days= on the expiring reports (larger values overflow date math)
+MAX_EXPIRING_DAYS = 365
+# Longest range the analytics reports will compute, counted back from ?to=
+MAX_ANALYTICS_DAYS = 5 * 365
+
+@app.route('/reports/expiring')
+@http_cache.conditional('users', 'subscription_types', 'renewal_candidates')
+def expiring_report():
+    days = min(max(request.args.get('days', 7, type=int), 1), MAX_EXPIRING_DAYS)
+    page = request.args.get('page', 1, type=int)
+    candidates_page = request.args.get('cpage', 1, type=int)
+    paginated_data = database.get_expiring_subscriptions(days=days, page=page, per_page=50)
+    candidates = database.get_renewal_candidates(page=candidates_page, per_page=50)
+    candidates_date = database.get_renewal_candidates_date()
+    return render_template('expiring.html',
+                          paginated_data=paginated_data,
+                          candidates=candidates,
+                          candidates_date=candidates_date,
+                          days=days,
+                          max_days=MAX_EXPIRING_DAYS)
+
+@app.route('/api/expiring')
+@http_cache.conditional('users', 'subscription_types')
+def api_expiring():
+    days = min(max(request.args.get('days', 7, type=int), 1), MAX_EXPIRING_DAYS)
+    page = request.args.get('page', 1, type=int)
+    per_page = min(request.args.get('per_page', 50, type=int), 200)
+    return jsonify(database.get_expiring_subscriptions(days=days, page=page, per_page=per_page))
+
+def analytics_params():
+    today = datetime.date.today()
+    # Default: the last 12 calendar months
+    default_from = (today.replace(day=1) - datetime.timedelta(days=335)).replace(day=1)
+    try:
+        date_from = datetime.date.fromisoformat(request.args.get('from', ''))
+    except ValueError:
+        date_from = default_from
+    try:
+        date_to = datetime.date.fromisoformat(request.args.get('to', ''))
+    except ValueError:
+        date_to = today
+    if date_from > date_to:
+        date_from, date_to = date_to, date_from
+    # Nothing is logged after today; past MAX_ANALYTICS_DAYS the body and the
+    # cohort table grow with the range (and year 9999 overflows date math)
+    date_to = min(date_to, today)
+    date_from = min(max(date_from, date_to - datetime.timedelta(days=MAX_ANALYTICS_DAYS)), date_to)
+    return date_from, date_to, request.args.get('type_id', None, type=int)
+
+@app.route('/reports/analytics')
+def analytics_report():
+    date_from, date_to, type_id = analytics_params()
+    status, result = analytics.get_analytics(db_path, date_from, date_to, type_id)
+    subscription_types = database.get_subscription_types()
+    return render_template('analytics.html',
+                          status=status,
+                          result=result,
+                          date_from=date_from.isoformat(),
+                          date_to=date_to.isoformat(),
+                          type_id=type_id,
+                          subscription_types=subscription_types)
+
+@app.route('/api/analytics')
+def api_analytics():
+    date_from, date_to, type_id = analytics_params()
+    status, result = analytics.get_analytics(db_path, date_from, date_to, type_id)
+    if status == 'pending':
+        return jsonify({'status': status}), 202
+    if status == 'error':
+        return jsonify({'status': status, 'message': result}), 500
+    return jsonify({'status': status, **result})
+
+@app.route('/api/renewal_candidates')
+@http_cache.conditional('users', 'renewal_candidates')
+def api_renewal_candidates():
+    page = request.args.get('page', 1, type=int)
+    per_page = min(request.args.get('per_page', 50, type=int), 200)
+    data = database.get_renewal_candidates(page=page, per_page=per_page)
+    computed_on = database.get_renewal_candidates_date()
+    data['computed_on'] = computed_on.strftime('%Y-%m-%d') if computed_on else None
+    return jsonify(data)
+
 if __name__ == '__main__':
     # Server web - rulează direct Flask
     app.run(host='0.0.0.0', port=5000, debug=False)
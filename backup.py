@@ -0,0 +1,222 @@
+"""Online snapshots of the SQLite database.
+
+Usage:
+    python backup.py snapshot [--dir backups]
+    python backup.py list [--dir backups]
+    python backup.py verify backups/access_control-20260101-030000.db
+    python backup.py restore backups/access_control-20260101-030000.db restored.db
+
+Snapshots are taken with SQLite's backup API a few pages per step, so scans
+keep writing while a snapshot runs. Restore always writes a new file; point
+the app at it (or swap it in) once it has been verified.
+"""
+import argparse
+import datetime
+import os
+import sqlite3
+import threading
+import time
+
+# Pages copied per backup step and the pause between steps (writers run in between)
+BACKUP_PAGES_PER_STEP = 64
+BACKUP_PAUSE_SECONDS = 0.01
+# Each write by another connection restarts the copy; past this, finish in one step
+MAX_RESTARTS = 5
+# Snapshot schedule and how many snapshots to keep
+BACKUP_INTERVAL_HOURS = 24
+BACKUP_KEEP = 7
+# A lock file older than this is left over from a crashed worker
+LOCK_STALE_SECONDS = 60 * 60
+
+SNAPSHOT_PREFIX = 'access_control-'
+SNAPSHOT_SUFFIX = '.db'
+LOCK_NAME = 'backup.lock'
+
+_snapshot_lock = threading.Lock()
+
+class BackupError(Exception):
+    pass
+
+class _Restarted(Exception):
+    pass
+
+def _copy(src_path, dst_path):
+    # Returns the number of restarts; the last attempt always completes
+    src = sqlite3.connect(src_path, timeout=5)
+    try:
+        for restarts in range(MAX_RESTARTS + 1):
+            if os.path.exists(dst_path):
+                os.remove(dst_path)
+            dst = sqlite3.connect(dst_path)
+            remaining_seen = [None]
+
+            def progress(status, remaining, total):
+                if remaining_seen[0] is not None and remaining > remaining_seen[0]:
+                    raise _Restarted()
+                remaining_seen[0] = remaining
+
+            try:
+                if restarts < MAX_RESTARTS:
+                    src.backup(dst, pages=BACKUP_PAGES_PER_STEP, progress=progress, sleep=BACKUP_PAUSE_SECONDS)
+                else:
+                    # One step is a single read transaction; in WAL mode it
+                    # still does not block writers
+                    src.backup(dst)
+                # Make the snapshot a self-contained file (no -wal next to it)
+                dst.execute('PRAGMA journal_mode=DELETE')
+                return restarts
+            except _Restarted:
+                continue
+            finally:
+                dst.close()
+    finally:
+        src.close()
+
+def verify_snapshot(path):
+    # Returns None if the file is a sound database, else the first problem found
+    if not os.path.exists(path):
+        return 'file not found'
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        result = conn.execute('PRAGMA integrity_check').fetchone()[0]
+        if result != 'ok':
+            return result
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if 'users' not in tables or 'access_logs' not in tables:
+            return 'not an access control database'
+        return None
+    except sqlite3.DatabaseError as e:
+        return str(e)
+    finally:
+        conn.close()
+
+def list_snapshots(backup_dir):
+    if not os.path.isdir(backup_dir):
+        return []
+    snapshots = []
+    for name in sorted(os.listdir(backup_dir), reverse=True):
+        if name.startswith(SNAPSHOT_PREFIX) and name.endswith(SNAPSHOT_SUFFIX):
+            path = os.path.join(backup_dir, name)
+            stat = os.stat(path)
+            snapshots.append({
+                'name': name,
+                'path': path,
+                'size': stat.st_size,
+                'created_at': datetime.datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S'),
+            })
+    return snapshots
+
+def _acquire_dir_lock(backup_dir):
+    # Every gunicorn worker runs the scheduler; only one may snapshot at a time
+    lock_path = os.path.join(backup_dir, LOCK_NAME)
+    try:
+        if time.time() - os.path.getmtime(lock_path) > LOCK_STALE_SECONDS:
+            os.remove(lock_path)
+    except OSError:
+        pass
+    try:
+        fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return None
+    os.close(fd)
+    return lock_path
+
+def prune_snapshots(backup_dir, keep=BACKUP_KEEP):
+    removed = 0
+    for snapshot in list_snapshots(backup_dir)[keep:]:
+        os.remove(snapshot['path'])
+        removed += 1
+    return removed
+
+def take_snapshot(db_path, backup_dir, keep=BACKUP_KEEP):
+    # Returns the snapshot info, or None if another worker is taking one
+    os.makedirs(backup_dir, exist_ok=True)
+    with _snapshot_lock:
+        lock_path = _acquire_dir_lock(backup_dir)
+        if lock_path is None:
+            return None
+        try:
+            name = SNAPSHOT_PREFIX + datetime.datetime.now().strftime('%Y%m%d-%H%M%S') + SNAPSHOT_SUFFIX
+            path = os.path.join(backup_dir, name)
+            part_path = path + '.part'
+            started = time.perf_counter()
+            restarts = _copy(db_path, part_path)
+
+            problem = verify_snapshot(part_path)
+            if problem:
+                os.remove(part_path)
+                raise BackupError(f'Snapshot failed integrity check: {problem}')
+            os.replace(part_path, path)
+            prune_snapshots(backup_dir, keep)
+        finally:
+            os.remove(lock_path)
+
+    snapshot = next(s for s in list_snapshots(backup_dir) if s['name'] == name)
+    snapshot['seconds'] = round(time.perf_counter() - started, 2)
+    snapshot['restarts'] = restarts
+    return snapshot
+
+def last_snapshot_time(backup_dir):
+    snapshots = list_snapshots(backup_dir)
+    if not snapshots:
+        return None
+    return datetime.datetime.fromtimestamp(os.path.getmtime(snapshots[0]['path']))
+
+def snapshot_due(backup_dir, interval_hours=BACKUP_INTERVAL_HOURS):
+    last = last_snapshot_time(backup_dir)
+    return last is None or datetime.datetime.now() - last >= datetime.timedelta(hours=interval_hours)
+
+def restore_snapshot(snapshot_path, target_path):
+    # Never overwrites: the live database stays untouched until it is swapped
+    if os.path.exists(target_path):
+        raise BackupError(f'{target_path} already exists')
+    problem = verify_snapshot(snapshot_path)
+    if problem:
+        raise BackupError(f'Snapshot failed integrity check: {problem}')
+    part_path = target_path + '.part'
+    _copy(snapshot_path, part_path)
+    problem = verify_snapshot(part_path)
+    if problem:
+        os.remove(part_path)
+        raise BackupError(f'Restored file failed integrity check: {problem}')
+    os.replace(part_path, target_path)
+    return target_path
+
+def main():
+    base_dir = os.path.abspath(os.path.dirname(__file__))
+    parser = argparse.ArgumentParser(description='Online snapshots of access_control.db.')
+    parser.add_argument('--db', default=os.path.join(base_dir, 'access_control.db'))
+    parser.add_argument('--dir', default=os.path.join(base_dir, 'backups'), help='snapshot directory')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('snapshot', help='take a snapshot now')
+    commands.add_parser('list', help='list snapshots, newest first')
+    verify = commands.add_parser('verify', help='run an integrity check on a snapshot')
+    verify.add_argument('snapshot')
+    restore = commands.add_parser('restore', help='copy a snapshot to a new database file')
+    restore.add_argument('snapshot')
+    restore.add_argument('target')
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'snapshot':
+            snapshot = take_snapshot(args.db, args.dir)
+            if snapshot is None:
+                print('Another snapshot is in progress')
+            else:
+                print(f"{snapshot['path']} ({snapshot['size']} bytes, {snapshot['seconds']}s)")
+        elif args.command == 'list':
+            for snapshot in list_snapshots(args.dir):
+                print(f"{snapshot['created_at']}  {snapshot['size']:>10d}  {snapshot['name']}")
+        elif args.command == 'verify':
+            problem = verify_snapshot(args.snapshot)
+            print(problem or 'ok')
+            return 1 if problem else 0
+        elif args.command == 'restore':
+            print(f'Restored to {restore_snapshot(args.snapshot, args.target)}')
+    except BackupError as e:
+        print(f'Error: {e}')
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,137 @@
+"""CPU and memory per 1k rows for the list queries.
+
+Usage:
+    python bench_rows.py [--rows 1000] [--repeat 20]
+
+Builds a throwaway database in a temp directory (the real access_control.db
+is not touched), fills it with --rows members, logs and subscriptions, and
+times get_user_logs, get_recent_logs and get_users_paginated against the
+ORM-entity + dict conversion they replaced ("orm" rows below). Peak memory
+is measured with tracemalloc over one call.
+"""
+import argparse
+import datetime
+import os
+import tempfile
+import time
+import tracemalloc
+
+from flask import Flask
+
+import database
+from database import db, read_session, AccessLog, ActiveSubscription, ClassParticipant, ClassSchedule, SubscriptionType, User
+
+# --- The previous implementations, kept here as the baseline ---
+
+def orm_dict(obj):
+    return {c.name: getattr(obj, c.name) for c in obj.__table__.columns}
+
+def orm_user_logs(user_id, limit):
+    logs = read_session.query(AccessLog).filter_by(user_id=user_id)\
+        .order_by(AccessLog.timestamp.desc()).limit(limit).all()
+    result = []
+    for log in logs:
+        row = orm_dict(log)
+        row['timestamp'] = row['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
+        result.append(row)
+    return result
+
+def orm_recent_logs(limit):
+    rows = read_session.query(AccessLog, User.name)\
+        .join(User, AccessLog.user_id == User.id).filter(User.deleted_at == None)\
+        .order_by(AccessLog.timestamp.desc()).limit(limit).all()
+    result = []
+    for log, name in rows:
+        row = orm_dict(log)
+        row['name'] = name
+        row['timestamp'] = row['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
+        result.append(row)
+    return result
+
+def orm_users_paginated(per_page):
+    query = read_session.query(User, ActiveSubscription.start_date, ActiveSubscription.end_date, SubscriptionType.name)\
+        .outerjoin(ActiveSubscription, (User.id == ActiveSubscription.user_id) & (ActiveSubscription.end_date >= datetime.date.today()))\
+        .outerjoin(SubscriptionType, ActiveSubscription.type_id == SubscriptionType.id)\
+        .filter(User.deleted_at == None).order_by(User.id.desc())
+    paginated = query.paginate(page=1, per_page=per_page, error_out=False)
+    users = []
+    for user, start_date, end_date, sub_name in paginated.items:
+        row = orm_dict(user)
+        class_names = [c[0] for c in read_session.query(ClassSchedule.name)
+                       .join(ClassParticipant, ClassParticipant.class_id == ClassSchedule.id)
+                       .filter(ClassParticipant.user_id == user.id).all()]
+        row['start_date'] = start_date.strftime('%Y-%m-%d') if start_date else None
+        row['end_date'] = end_date.strftime('%Y-%m-%d') if end_date else None
+        row['sub_name'] = f"{sub_name} + {', '.join(class_names)}" if class_names else sub_name
+        users.append(row)
+    return database.pagination_dict(paginated, users)
+
+# --- Setup and measurement ---
+
+def make_app(db_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_path
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    database.init_db(app)
+    return app
+
+def seed(rows):
+    today = datetime.date.today()
+    now = datetime.datetime.now()
+    sub_type = SubscriptionType.query.first()
+    yoga = ClassSchedule(name='Yoga', day_of_week=0, start_time='10:00', capacity=rows, price=10.0)
+    db.session.add(yoga)
+    users = [User(name=f'Member {i}', phone=f'07{i:08d}', rfid_tag=f'BENCH-{i}') for i in range(rows)]
+    db.session.add_all(users)
+    db.session.flush()
+    for i, user in enumerate(users):
+        db.session.add(ActiveSubscription(user_id=user.id, type_id=sub_type.id, start_date=today, end_date=today + datetime.timedelta(days=30)))
+        if i % 3 == 0:
+            db.session.add(ClassParticipant(user_id=user.id, class_id=yoga.id))
+        db.session.add(AccessLog(user_id=users[0].id, timestamp=now - datetime.timedelta(minutes=i), allowed=True, reason='ok'))
+    db.session.commit()
+    return users[0].id
+
+def measure(fn, repeat):
+    fn()
+    read_session.remove()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+        read_session.remove()
+    elapsed = (time.perf_counter() - started) / repeat * 1000
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    read_session.remove()
+    return elapsed, peak / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description='CPU and memory per 1k rows for the list queries.')
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            user_id = seed(args.rows)
+            n = args.rows
+            cases = [
+                ('get_user_logs', lambda: orm_user_logs(user_id, n), lambda: database.get_user_logs(user_id, limit=n)),
+                ('get_recent_logs', lambda: orm_recent_logs(n), lambda: database.get_recent_logs(limit=n)),
+                ('get_users_paginated', lambda: orm_users_paginated(n), lambda: database.get_users_paginated(page=1, per_page=n)),
+            ]
+            scale = 1000 / n
+            print(f"{'query':22s} {'orm ms':>9s} {'rows ms':>9s} {'orm KB':>9s} {'rows KB':>9s}   (per 1k rows, {n} rows)")
+            for name, before, after in cases:
+                before_ms, before_kb = measure(before, args.repeat)
+                after_ms, after_kb = measure(after, args.repeat)
+                print(f"{name:22s} {before_ms * scale:9.1f} {after_ms * scale:9.1f} {before_kb * scale:9.0f} {after_kb * scale:9.0f}")
+            read_session.remove()
+
+if __name__ == '__main__':
+    main()
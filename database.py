@@ -1,9 +1,23 @@
 import datetime
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+from flask import g
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.query import Query
 from flask_babel import gettext as _
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import scoped_session, sessionmaker
 
 db = SQLAlchemy()
 
+# Dashboards and reports read through their own small pool of query-only
+# connections, so a heavy report never queues in front of door scans on
+# the writer (db.session). Bound in init_read_engine().
+read_session = scoped_session(sessionmaker(query_cls=Query))
+READ_POOL_SIZE = 4
+
 class User(db.Model):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
@@ -11,6 +25,10 @@ class User(db.Model):
     phone = db.Column(db.String, nullable=False, unique=True)
     rfid_tag = db.Column(db.String, nullable=False, unique=True)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    # Set by delete_user(); the row is removed later by the purge worker
+    deleted_at = db.Column(db.DateTime, nullable=True)
+    # Bumped by every mutation that changes the member's row on /users
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
 class SubscriptionType(db.Model):
     __tablename__ = 'subscription_types'
@@ -19,6 +37,7 @@ class SubscriptionType(db.Model):
     entries_per_week = db.Column(db.Integer)
     duration_days = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Float, nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
 class ActiveSubscription(db.Model):
     __tablename__ = 'active_subscriptions'
@@ -28,6 +47,21 @@ class ActiveSubscription(db.Model):
     start_date = db.Column(db.Date, nullable=False)
     end_date = db.Column(db.Date, nullable=False)
 
+    # Expiry-ordered index so "expiring in N days" is a range scan, not a table scan
+    __table_args__ = (
+        db.Index('ix_active_subscriptions_end_date', 'end_date', 'user_id'),
+        db.Index('ix_active_subscriptions_user_end', 'user_id', 'end_date'),
+    )
+
+class RenewalCandidate(db.Model):
+    # Snapshot written once a day by compute_renewal_candidates()
+    __tablename__ = 'renewal_candidates'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    subscription_id = db.Column(db.Integer, db.ForeignKey('active_subscriptions.id'), nullable=False)
+    end_date = db.Column(db.Date, nullable=False, index=True)
+    computed_on = db.Column(db.Date, nullable=False, index=True)
+
 class AccessLog(db.Model):
     __tablename__ = 'access_logs'
     id = db.Column(db.Integer, primary_key=True)
@@ -36,6 +70,11 @@ class AccessLog(db.Model):
     allowed = db.Column(db.Boolean, nullable=False)
     reason = db.Column(db.String)
 
+    __table_args__ = (
+        db.Index('ix_access_logs_user_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_access_logs_timestamp', 'timestamp'),
+    )
+
 class ClassSchedule(db.Model):
     __tablename__ = 'class_schedules'
     id = db.Column(db.Integer, primary_key=True)
@@ -44,6 +83,7 @@ class ClassSchedule(db.Model):
     start_time = db.Column(db.String(5), nullable=False) # Format: HH:MM
     capacity = db.Column(db.Integer)
     price = db.Column(db.Float, nullable=False, default=0.0)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
 class ClassParticipant(db.Model):
     __tablename__ = 'class_participants'
@@ -53,9 +93,78 @@ class ClassParticipant(db.Model):
     enrolled_at = db.Column(db.DateTime, default=datetime.datetime.now)
     end_date = db.Column(db.Date, nullable=True)
 
+class PurgeJob(db.Model):
+    # Background deletion processed in small batches by jobs.py
+    __tablename__ = 'purge_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String, nullable=False) # 'user' or 'logs'
+    user_id = db.Column(db.Integer, nullable=True)
+    date_from = db.Column(db.Date, nullable=True)
+    date_to = db.Column(db.Date, nullable=True)
+    status = db.Column(db.String, nullable=False, default='pending') # pending, running, done, failed
+    deleted_rows = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.now)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+class CacheVersion(db.Model):
+    # Table-wide change counters, shared by all gunicorn workers
+    __tablename__ = 'cache_versions'
+    name = db.Column(db.String, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+
+CACHE_VERSION_NAMES = ('subscription_types', 'class_schedules', 'users', 'access_logs', 'purge_jobs', 'renewal_candidates')
+
+# Rows removed per purge transaction; keeps the SQLite write lock short
+PURGE_BATCH_SIZE = 500
+
+# Serializes check_and_log_access() within one worker process
+_scan_lock = threading.Lock()
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA busy_timeout = 5000')
+    cursor.close()
+
+def _set_read_only_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA busy_timeout = 5000')
+    cursor.execute('PRAGMA query_only = ON')
+    cursor.close()
+
+def init_read_engine(app):
+    read_engine = db.create_engine(db.engine.url, pool_size=READ_POOL_SIZE, max_overflow=0)
+    event.listen(read_engine, 'connect', _set_read_only_pragmas)
+    read_session.configure(bind=read_engine)
+
+    @app.teardown_appcontext
+    def remove_read_session(exception=None):
+        read_session.remove()
+
 def init_db(app):
     with app.app_context():
+        event.listen(db.engine, 'connect', _set_sqlite_pragmas)
+        # WAL lets the reader pool run alongside the writer without blocking it
+        db.session.execute(db.text('PRAGMA journal_mode=WAL'))
         db.create_all()
+
+        # create_all() skips new columns and indexes on tables that already exist
+        new_columns = [
+            ('users', 'deleted_at', 'DATETIME'),
+            ('users', 'version', 'INTEGER NOT NULL DEFAULT 1'),
+            ('subscription_types', 'version', 'INTEGER NOT NULL DEFAULT 1'),
+            ('class_schedules', 'version', 'INTEGER NOT NULL DEFAULT 1'),
+        ]
+        inspector = db.inspect(db.engine)
+        for table, column, ddl in new_columns:
+            if column not in [c['name'] for c in inspector.get_columns(table)]:
+                db.session.execute(db.text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+        for name in CACHE_VERSION_NAMES:
+            if not CacheVersion.query.get(name):
+                db.session.add(CacheVersion(name=name, version=1))
+        db.session.commit()
+        for model in (ActiveSubscription, AccessLog):
+            for index in model.__table__.indexes:
+                index.create(bind=db.engine, checkfirst=True)
         
         # Populate initial subscription types if needed
         if not SubscriptionType.query.first():
@@ -67,19 +176,144 @@ def init_db(app):
             db.session.add_all(types)
             db.session.commit()
 
-def dict_helper(obj):
-    if obj is None:
+        init_read_engine(app)
+
+# --- Row mappers ---
+# Read paths select only the columns they need and turn each result tuple
+# into a dict with a mapper built once at import time. Dates and timestamps
+# for display are formatted by SQLite in the same query.
+
+def formatted(column, fmt):
+    return db.func.strftime(fmt, column).label(column.key)
+
+def row_mapper(columns):
+    keys = tuple(c.key for c in columns)
+    def to_dict(row):
+        if row is None:
+            return None
+        return dict(zip(keys, row))
+    return to_dict
+
+USER_COLUMNS = (User.id, User.name, User.phone, User.rfid_tag, User.created_at)
+LOG_COLUMNS = (AccessLog.id, AccessLog.user_id, formatted(AccessLog.timestamp, '%Y-%m-%d %H:%M:%S'), AccessLog.allowed, AccessLog.reason)
+SUBSCRIPTION_COLUMNS = (ActiveSubscription.id, ActiveSubscription.user_id, ActiveSubscription.type_id, ActiveSubscription.start_date, ActiveSubscription.end_date, SubscriptionType.name.label('sub_name'))
+CLASS_COLUMNS = (ClassSchedule.id, ClassSchedule.name, ClassSchedule.day_of_week, ClassSchedule.start_time, ClassSchedule.capacity, ClassSchedule.price, ClassSchedule.version)
+PURGE_JOB_COLUMNS = (PurgeJob.id, PurgeJob.kind, PurgeJob.user_id, formatted(PurgeJob.date_from, '%Y-%m-%d'), formatted(PurgeJob.date_to, '%Y-%m-%d'),
+                     PurgeJob.status, PurgeJob.deleted_rows, formatted(PurgeJob.created_at, '%Y-%m-%d %H:%M:%S'), formatted(PurgeJob.finished_at, '%Y-%m-%d %H:%M:%S'))
+USER_LIST_COLUMNS = USER_COLUMNS + (User.version, formatted(ActiveSubscription.start_date, '%Y-%m-%d'), formatted(ActiveSubscription.end_date, '%Y-%m-%d'), SubscriptionType.name.label('sub_name'))
+RECENT_LOG_COLUMNS = LOG_COLUMNS + (User.name, User.version.label('user_version'))
+USER_CLASS_COLUMNS = CLASS_COLUMNS + (formatted(ClassParticipant.end_date, '%Y-%m-%d'),)
+
+user_row = row_mapper(USER_COLUMNS)
+log_row = row_mapper(LOG_COLUMNS)
+subscription_row = row_mapper(SUBSCRIPTION_COLUMNS)
+purge_job_row = row_mapper(PURGE_JOB_COLUMNS)
+user_list_row = row_mapper(USER_LIST_COLUMNS)
+recent_log_row = row_mapper(RECENT_LOG_COLUMNS)
+user_class_row = row_mapper(USER_CLASS_COLUMNS)
+
+# --- Versions ---
+# Mutations bump these before they commit; caches (e.g. rendered fragments)
+# key on them, so every worker sees a change on its next read.
+
+def bump_user_version(user_id):
+    User.query.filter_by(id=user_id).update({'version': User.version + 1})
+    bump_cache_version('users')
+
+def bump_cache_version(name):
+    CacheVersion.query.filter_by(name=name).update({'version': CacheVersion.version + 1})
+
+def get_cache_versions():
+    return dict(read_session.query(CacheVersion.name, CacheVersion.version).all())
+
+# --- Reference data ---
+# Subscription types and class schedules change about once a month but are
+# read by most pages and by every class-member scan. Each worker keeps one
+# immutable snapshot and replaces it whole; a worker that did not make the
+# change notices through the cache_versions counters.
+
+REFERENCE_VERSION_NAMES = ('subscription_types', 'class_schedules')
+SUBSCRIPTION_TYPE_COLUMNS = (SubscriptionType.id, SubscriptionType.name, SubscriptionType.entries_per_week, SubscriptionType.duration_days, SubscriptionType.price, SubscriptionType.version)
+
+SubscriptionTypeRef = namedtuple('SubscriptionTypeRef', [c.key for c in SUBSCRIPTION_TYPE_COLUMNS])
+ClassRef = namedtuple('ClassRef', [c.key for c in CLASS_COLUMNS])
+ReferenceData = namedtuple('ReferenceData', 'versions subscription_types classes subscription_types_by_id classes_by_id')
+
+_reference = None
+_reference_lock = threading.Lock()
+
+def _reference_versions(session):
+    rows = session.query(CacheVersion.name, CacheVersion.version)\
+        .filter(CacheVersion.name.in_(REFERENCE_VERSION_NAMES)).all()
+    versions = dict(rows)
+    return tuple(versions.get(name, 0) for name in REFERENCE_VERSION_NAMES)
+
+def _is_current(snapshot, versions):
+    # Counters only go up; a session on an older read snapshot may see lower ones
+    return snapshot is not None and all(a >= b for a, b in zip(snapshot.versions, versions))
+
+def load_reference_data(session, versions):
+    # Same session (and read transaction) as the version check, so the rows match it
+    sub_types = tuple(SubscriptionTypeRef(*row) for row in session.execute(
+        db.select(*SUBSCRIPTION_TYPE_COLUMNS).order_by(SubscriptionType.id)))
+    classes = tuple(ClassRef(*row) for row in session.execute(
+        db.select(*CLASS_COLUMNS).order_by(ClassSchedule.day_of_week, ClassSchedule.start_time)))
+    return ReferenceData(
+        versions=versions,
+        subscription_types=sub_types,
+        classes=classes,
+        subscription_types_by_id=MappingProxyType({st.id: st for st in sub_types}),
+        classes_by_id=MappingProxyType({c.id: c for c in classes}),
+    )
+
+def _current_reference_data(session):
+    global _reference
+    versions = _reference_versions(session)
+    snapshot = _reference
+    if _is_current(snapshot, versions):
+        return snapshot
+
+    with _reference_lock:
+        if _is_current(_reference, versions):
+            return _reference
+        snapshot = load_reference_data(session, versions)
+        if not _is_current(_reference, snapshot.versions):
+            _reference = snapshot
+    return snapshot
+
+def get_reference_data(session=None):
+    # The version check runs once per request; later calls reuse its answer
+    snapshot = g.get('reference_data')
+    if snapshot is None:
+        snapshot = g.reference_data = _current_reference_data(session or read_session)
+    return snapshot
+
+def refresh_reference_data():
+    # Called right after a commit that changed reference data in this worker.
+    # The write is already committed, so a failed reload is not an error for
+    # the caller: drop the memoized snapshot and let the next read retry.
+    try:
+        g.reference_data = _current_reference_data(db.session)
+    except Exception as e:
+        print(f"Error reloading reference data: {e}")
+        g.pop('reference_data', None)
         return None
-    return {c.name: getattr(obj, c.name) for c in obj.__table__.columns}
+    return g.reference_data
+
+def get_subscription_types():
+    return get_reference_data().subscription_types
 
 def get_user_by_rfid(rfid_tag):
-    user = User.query.filter_by(rfid_tag=rfid_tag).first()
-    return dict_helper(user)
+    row = db.session.execute(
+        db.select(*USER_COLUMNS).where(User.rfid_tag == rfid_tag, User.deleted_at == None)
+    ).first()
+    return user_row(row)
 
 def create_user(name, phone, rfid_tag):
     try:
         user = User(name=name, phone=phone, rfid_tag=rfid_tag)
         db.session.add(user)
+        bump_cache_version('users')
         db.session.commit()
         return user.id
     except Exception as e:
@@ -105,6 +339,7 @@ def assign_subscription(user_id, type_id):
         end_date=end_date
     )
     db.session.add(sub)
+    bump_user_version(user_id)
     db.session.commit()
     return True
 
@@ -127,6 +362,7 @@ def enroll_user_in_class(user_id, class_id, duration_days=None):
             
         participant = ClassParticipant(user_id=user_id, class_id=class_id, end_date=end_date)
         db.session.add(participant)
+        bump_user_version(user_id)
         db.session.commit()
         return True
     except Exception as e:
@@ -137,18 +373,53 @@ def enroll_user_in_class(user_id, class_id, duration_days=None):
 def log_access(user_id, allowed, reason):
     log = AccessLog(user_id=user_id, allowed=allowed, reason=reason)
     db.session.add(log)
+    bump_cache_version('access_logs')
     db.session.commit()
 
+def check_and_log_access(user_id):
+    # Decide and log in one BEGIN IMMEDIATE transaction. SQLite grants the
+    # write lock up front, so two near-simultaneous scans of the same card
+    # (two turnstiles, two gunicorn workers) are serialized and the second
+    # one sees the first one's log when counting entries_per_week.
+    db.session.commit()
+    # Threads of this worker queue here instead of in SQLite's busy handler,
+    # which backs off with sleeps of up to 100ms
+    with _scan_lock:
+        try:
+            db.session.connection().exec_driver_sql('BEGIN IMMEDIATE')
+            allowed, message, status_code, sub_name, weekly_count = check_access(user_id)
+            # The previously recorded attempt, read before saving this new one
+            last_log = get_last_log(user_id)
+            db.session.add(AccessLog(user_id=user_id, allowed=allowed, reason=message))
+            bump_cache_version('access_logs')
+            db.session.commit()
+            return allowed, message, status_code, sub_name, weekly_count, last_log
+        except Exception:
+            db.session.rollback()
+            raise
+
 def check_access(user_id):
     today = datetime.date.today()
     
-    subscription_data = db.session.query(ActiveSubscription, SubscriptionType)\
-        .join(SubscriptionType, ActiveSubscription.type_id == SubscriptionType.id)\
-        .filter(ActiveSubscription.user_id == user_id)\
-        .filter(ActiveSubscription.start_date <= today)\
-        .filter(ActiveSubscription.end_date >= today)\
-        .order_by(ActiveSubscription.end_date.desc())\
-        .first()
+    reference = get_reference_data(db.session)
+
+    subscription_data = None
+    for sub in ActiveSubscription.query\
+            .filter(ActiveSubscription.user_id == user_id)\
+            .filter(ActiveSubscription.start_date <= today)\
+            .filter(ActiveSubscription.end_date >= today)\
+            .order_by(ActiveSubscription.end_date.desc()):
+        sub_type = reference.subscription_types_by_id.get(sub.type_id)
+        if sub_type:
+            subscription_data = sub, sub_type
+            break
+
+    # Enrolled classes that haven't expired; class rows come from the reference snapshot
+    enrolled_ids = [row[0] for row in db.session.query(ClassParticipant.class_id)
+                    .filter(ClassParticipant.user_id == user_id)
+                    .filter(db.or_(ClassParticipant.end_date >= today, ClassParticipant.end_date == None))
+                    .all()]
+    enrolled_classes = [reference.classes_by_id[class_id] for class_id in enrolled_ids if class_id in reference.classes_by_id]
 
     # Calculate start of week globally
     start_of_week = today - datetime.timedelta(days=today.weekday())
@@ -159,19 +430,12 @@ def check_access(user_id):
         .count()
 
     if not subscription_data:
-        # Check all enrolled classes for this user that haven't expired
-        all_enrolled = db.session.query(ClassSchedule)\
-            .join(ClassParticipant, ClassParticipant.class_id == ClassSchedule.id)\
-            .filter(ClassParticipant.user_id == user_id)\
-            .filter(db.or_(ClassParticipant.end_date >= today, ClassParticipant.end_date == None))\
-            .all()
-            
-        if not all_enrolled:
+        if not enrolled_classes:
             return False, _("No active subscription or class found."), "denied", None, count
             
         # Check if any class is scheduled for today
         current_day_of_week = today.weekday()
-        classes_today = [c for c in all_enrolled if c.day_of_week == current_day_of_week]
+        classes_today = [c for c in enrolled_classes if c.day_of_week == current_day_of_week]
         
         if classes_today:
             now = datetime.datetime.now()
@@ -197,19 +461,14 @@ def check_access(user_id):
                 return False, _("Access Denied. Next class today at: %(details)s", details=class_details), "denied", class_details, count
             
         # If they have classes but none today
-        class_names_all = ", ".join([c.name for c in all_enrolled])
+        class_names_all = ", ".join([c.name for c in enrolled_classes])
         return False, _("Access Denied. Your classes (%(classes)s) are not scheduled for today.", classes=class_names_all), "denied", class_names_all, count
         
     sub, sub_type = subscription_data
     sub_name = sub_type.name
 
     # Append any enrolled classes to the sub_name for display
-    user_classes = db.session.query(ClassSchedule.name)\
-        .join(ClassParticipant, ClassParticipant.class_id == ClassSchedule.id)\
-        .filter(ClassParticipant.user_id == user_id)\
-        .filter(db.or_(ClassParticipant.end_date >= today, ClassParticipant.end_date == None))\
-        .all()
-    class_names = [c[0] for c in user_classes]
+    class_names = [c.name for c in enrolled_classes]
     
     if class_names:
         sub_name = f"{sub_name} + {', '.join(class_names)}"
@@ -226,9 +485,10 @@ def check_access(user_id):
     return True, _("Access Granted"), "allowed", sub_name, count
 
 def get_users_paginated(page=1, per_page=50, search_name=None, search_phone=None, search_sub_id=None, search_class_id=None):
-    query = db.session.query(User, ActiveSubscription.start_date, ActiveSubscription.end_date, SubscriptionType.name.label('sub_name'), SubscriptionType.id.label('sub_type_id'))\
+    query = read_session.query(*USER_LIST_COLUMNS)\
         .outerjoin(ActiveSubscription, (User.id == ActiveSubscription.user_id) & (ActiveSubscription.end_date >= datetime.date.today()))\
-        .outerjoin(SubscriptionType, ActiveSubscription.type_id == SubscriptionType.id)
+        .outerjoin(SubscriptionType, ActiveSubscription.type_id == SubscriptionType.id)\
+        .filter(User.deleted_at == None)
         
     if search_name:
         query = query.filter(User.name.ilike(f"%{search_name}%"))
@@ -248,35 +508,30 @@ def get_users_paginated(page=1, per_page=50, search_name=None, search_phone=None
     query = query.order_by(User.id.desc())
     paginated = query.paginate(page=page, per_page=per_page, error_out=False)
         
-    users = []
-    for user, start_date, end_date, sub_name, sub_type_id in paginated.items:
-        u_dict = dict_helper(user)
-        
-        user_classes = db.session.query(ClassSchedule.name)\
-            .join(ClassParticipant, ClassParticipant.class_id == ClassSchedule.id)\
-            .filter(ClassParticipant.user_id == user.id)\
-            .all()
-        class_names = [c[0] for c in user_classes]
-
-        if start_date and isinstance(start_date, datetime.date):
-            u_dict['start_date'] = start_date.strftime('%Y-%m-%d')
-        else:
-            u_dict['start_date'] = start_date
+    users = [user_list_row(row) for row in paginated.items]
 
-        if end_date and isinstance(end_date, datetime.date):
-            u_dict['end_date'] = end_date.strftime('%Y-%m-%d')
-        else:
-            u_dict['end_date'] = end_date
-            
-        if class_names:
-            u_dict['sub_name'] = f"{sub_name} + {', '.join(class_names)}" if sub_name else ", ".join(class_names)
-        else:
-            u_dict['sub_name'] = sub_name
-            
-        users.append(u_dict)
+    # Class names for the whole page in one query
+    class_names = {}
+    if users:
+        user_classes = read_session.execute(
+            db.select(ClassParticipant.user_id, ClassSchedule.name)
+            .join(ClassSchedule, ClassParticipant.class_id == ClassSchedule.id)
+            .where(ClassParticipant.user_id.in_([u['id'] for u in users]))
+        )
+        for user_id, class_name in user_classes:
+            class_names.setdefault(user_id, []).append(class_name)
+
+    for u_dict in users:
+        names = class_names.get(u_dict['id'])
+        if names:
+            sub_name = u_dict['sub_name']
+            u_dict['sub_name'] = f"{sub_name} + {', '.join(names)}" if sub_name else ", ".join(names)
         
+    return pagination_dict(paginated, users)
+
+def pagination_dict(paginated, items):
     return {
-        'items': users,
+        'items': items,
         'pa_total': paginated.total,
         'pa_pages': paginated.pages,
         'pa_page': paginated.page,
@@ -287,23 +542,21 @@ def get_users_paginated(page=1, per_page=50, search_name=None, search_phone=None
     }
 
 def get_user_by_id(user_id):
-    user = User.query.get(user_id)
-    return dict_helper(user)
+    row = read_session.execute(
+        db.select(*USER_COLUMNS).where(User.id == user_id, User.deleted_at == None)
+    ).first()
+    return user_row(row)
 
 def get_active_subscription(user_id):
-    sub_data = db.session.query(ActiveSubscription, SubscriptionType)\
-        .join(SubscriptionType, ActiveSubscription.type_id == SubscriptionType.id)\
-        .filter(ActiveSubscription.user_id == user_id)\
-        .filter(ActiveSubscription.end_date >= datetime.date.today())\
-        .order_by(ActiveSubscription.end_date.desc())\
-        .first()
-        
-    if sub_data:
-        sub, sub_type = sub_data
-        s_dict = dict_helper(sub)
-        s_dict['sub_name'] = sub_type.name
-        return s_dict
-    return None
+    row = read_session.execute(
+        db.select(*SUBSCRIPTION_COLUMNS)
+        .join(SubscriptionType, ActiveSubscription.type_id == SubscriptionType.id)
+        .where(ActiveSubscription.user_id == user_id)
+        .where(ActiveSubscription.end_date >= datetime.date.today())
+        .order_by(ActiveSubscription.end_date.desc())
+        .limit(1)
+    ).first()
+    return subscription_row(row)
 
 def update_user(user_id, name, phone, rfid_tag):
     try:
@@ -312,6 +565,8 @@ def update_user(user_id, name, phone, rfid_tag):
             user.name = name
             user.phone = phone
             user.rfid_tag = rfid_tag
+            user.version = User.version + 1
+            bump_cache_version('users')
             db.session.commit()
     except Exception as e:
         print(f"Error updating user: {e}")
@@ -327,17 +582,26 @@ def extend_current_subscription(user_id, days):
             
         if sub:
             sub.end_date = sub.end_date + datetime.timedelta(days=days)
+            bump_user_version(user_id)
             db.session.commit()
     except Exception as e:
         print(f"Error extending subscription: {e}")
         db.session.rollback()
 
 def delete_user(user_id):
+    # Soft delete: hide the user now, let the purge worker remove dependent rows in batches
     try:
-        AccessLog.query.filter_by(user_id=user_id).delete()
-        ActiveSubscription.query.filter_by(user_id=user_id).delete()
-        ClassParticipant.query.filter_by(user_id=user_id).delete()
-        User.query.filter_by(id=user_id).delete()
+        user = User.query.filter_by(id=user_id, deleted_at=None).first()
+        if not user:
+            return False
+        user.deleted_at = datetime.datetime.now()
+        # Free the unique phone / RFID tag so the card can be registered again right away
+        user.phone = f"deleted:{user.id}:{user.phone}"
+        user.rfid_tag = f"deleted:{user.id}:{user.rfid_tag}"
+        user.version = User.version + 1
+        bump_cache_version('users')
+        db.session.add(PurgeJob(kind='user', user_id=user_id))
+        bump_cache_version('purge_jobs')
         db.session.commit()
         return True
     except Exception as e:
@@ -345,9 +609,89 @@ def delete_user(user_id):
         db.session.rollback()
         return False
 
+def delete_logs_between(date_from, date_to):
+    # Bulk log deletion by date range (inclusive), done by the purge worker
+    try:
+        if date_from > date_to:
+            return None
+        job = PurgeJob(kind='logs', date_from=date_from, date_to=date_to)
+        db.session.add(job)
+        bump_cache_version('purge_jobs')
+        db.session.commit()
+        return job.id
+    except Exception as e:
+        print(f"Error scheduling log deletion: {e}")
+        db.session.rollback()
+        return None
+
+def _purge_batch(model, *criteria):
+    ids = db.select(model.id).where(*criteria).limit(PURGE_BATCH_SIZE)
+    result = db.session.execute(db.delete(model).where(model.id.in_(ids)))
+    return result.rowcount
+
+def run_purge_step():
+    # Deletes at most PURGE_BATCH_SIZE rows in one short transaction.
+    # Returns False when there is nothing left to do.
+    job = PurgeJob.query.filter(PurgeJob.status.in_(['pending', 'running']))\
+        .order_by(PurgeJob.id).first()
+    if not job:
+        return False
+
+    try:
+        job.status = 'running'
+        deleted = 0
+        if job.kind == 'user':
+            for model in (AccessLog, RenewalCandidate, ClassParticipant, ActiveSubscription):
+                deleted = _purge_batch(model, model.user_id == job.user_id)
+                if deleted:
+                    break
+            if not deleted:
+                User.query.filter(User.id == job.user_id, User.deleted_at != None).delete()
+                job.status = 'done'
+        elif job.kind == 'logs':
+            start = datetime.datetime.combine(job.date_from, datetime.time.min)
+            end = datetime.datetime.combine(job.date_to + datetime.timedelta(days=1), datetime.time.min)
+            deleted = _purge_batch(AccessLog, AccessLog.timestamp >= start, AccessLog.timestamp < end)
+            if not deleted:
+                job.status = 'done'
+        else:
+            job.status = 'failed'
+
+        # SQL-side increment; several workers may share a job
+        job.deleted_rows = PurgeJob.deleted_rows + deleted
+        bump_cache_version('purge_jobs')
+        if deleted:
+            bump_cache_version('access_logs')
+        if job.kind == 'user':
+            # Subscription and enrollment rows feed the /reports and /admin counts
+            bump_cache_version('users')
+        if job.status in ('done', 'failed'):
+            job.finished_at = datetime.datetime.now()
+        db.session.commit()
+    except OperationalError as e:
+        # e.g. "database is locked" after busy_timeout: leave the job queued,
+        # the worker retries it on its next poll
+        print(f"Purge step postponed: {e}")
+        db.session.rollback()
+        return False
+    except Exception as e:
+        print(f"Error purging rows: {e}")
+        db.session.rollback()
+        PurgeJob.query.filter_by(id=job.id).update({'status': 'failed', 'finished_at': datetime.datetime.now()})
+        bump_cache_version('purge_jobs')
+        db.session.commit()
+    return True
+
+def get_purge_jobs(limit=20):
+    rows = read_session.execute(
+        db.select(*PURGE_JOB_COLUMNS).order_by(PurgeJob.id.desc()).limit(limit)
+    )
+    return [purge_job_row(row) for row in rows]
+
 def delete_log(log_id):
     try:
         AccessLog.query.filter_by(id=log_id).delete()
+        bump_cache_version('access_logs')
         db.session.commit()
         return True
     except Exception as e:
@@ -357,13 +701,13 @@ def delete_log(log_id):
 
 def get_last_log(user_id):
     try:
-        log = AccessLog.query.filter_by(user_id=user_id).order_by(AccessLog.timestamp.desc()).first()
-        if log:
-            l_dict = dict_helper(log)
-            # Format timestamp safely
-            if hasattr(l_dict['timestamp'], 'strftime'):
-                l_dict['timestamp'] = l_dict['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
-            return l_dict
+        row = db.session.execute(
+            db.select(*LOG_COLUMNS)
+            .where(AccessLog.user_id == user_id)
+            .order_by(AccessLog.timestamp.desc())
+            .limit(1)
+        ).first()
+        return log_row(row)
     except Exception as e:
         print(f"Error fetching last log: {e}")
     return None
@@ -378,12 +722,14 @@ def create_subscription_type(name, entries_per_week, duration_days, price):
             price=float(price)
         )
         db.session.add(sub_type)
+        bump_cache_version('subscription_types')
         db.session.commit()
-        return True
     except Exception as e:
         print(f"Error creating subscription type: {e}")
         db.session.rollback()
         return False
+    refresh_reference_data()
+    return True
 
 def delete_subscription_type(type_id):
     try:
@@ -393,12 +739,14 @@ def delete_subscription_type(type_id):
             return False, _("Cannot delete. There are active users with this subscription.")
         
         SubscriptionType.query.filter_by(id=type_id).delete()
+        bump_cache_version('subscription_types')
         db.session.commit()
-        return True, _("Subscription type deleted.")
     except Exception as e:
         print(f"Error deleting subscription type: {e}")
         db.session.rollback()
         return False, _("Error deleting subscription type.")
+    refresh_reference_data()
+    return True, _("Subscription type deleted.")
 
 def create_class_schedule(name, day_of_week, start_time, capacity, price=0.0):
     try:
@@ -416,12 +764,14 @@ def create_class_schedule(name, day_of_week, start_time, capacity, price=0.0):
             price=float(price) if price else 0.0
         )
         db.session.add(new_class)
+        bump_cache_version('class_schedules')
         db.session.commit()
-        return True
     except Exception as e:
         print(f"Error creating class schedule: {e}")
         db.session.rollback()
         return False
+    refresh_reference_data()
+    return True
 
 def update_subscription_type(type_id, name, entries_per_week, duration_days, price):
     try:
@@ -431,12 +781,15 @@ def update_subscription_type(type_id, name, entries_per_week, duration_days, pri
             st.entries_per_week = int(entries_per_week) if entries_per_week else None
             st.duration_days = int(duration_days)
             st.price = float(price)
+            st.version = SubscriptionType.version + 1
+            bump_cache_version('subscription_types')
             db.session.commit()
-        return True
     except Exception as e:
         print(f"Error updating subscription type: {e}")
         db.session.rollback()
         return False
+    refresh_reference_data()
+    return True
 
 def update_class_schedule(class_id, name, day_of_week, start_time, capacity, price):
     try:
@@ -449,41 +802,47 @@ def update_class_schedule(class_id, name, day_of_week, start_time, capacity, pri
             c.start_time = start_time
             c.capacity = int(capacity) if capacity else None
             c.price = float(price) if price else 0.0
+            c.version = ClassSchedule.version + 1
+            bump_cache_version('class_schedules')
             db.session.commit()
-        return True
     except Exception as e:
         print(f"Error updating class schedule: {e}")
         db.session.rollback()
         return False
+    refresh_reference_data()
+    return True
 
 def get_all_classes():
-    classes = ClassSchedule.query.order_by(ClassSchedule.day_of_week, ClassSchedule.start_time).all()
-    return [dict_helper(c) for c in classes]
+    return get_reference_data().classes
 
 def delete_class_schedule(class_id):
     try:
         ClassSchedule.query.filter_by(id=class_id).delete()
+        bump_cache_version('class_schedules')
         db.session.commit()
-        return True
     except Exception as e:
         print(f"Error deleting class schedule: {e}")
         db.session.rollback()
         return False
+    refresh_reference_data()
+    return True
 
 def get_report_stats():
     today = datetime.date.today()
     days_map = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
 
     # --- Subscription stats ---
-    sub_types = SubscriptionType.query.all()
+    sub_types = read_session.query(SubscriptionType).all()
     subscription_stats = []
     for st in sub_types:
-        active_count = db.session.query(db.func.count(ActiveSubscription.id))\
+        active_count = read_session.query(db.func.count(ActiveSubscription.id))\
+            .join(User, ActiveSubscription.user_id == User.id).filter(User.deleted_at == None)\
             .filter(ActiveSubscription.type_id == st.id)\
             .filter(ActiveSubscription.end_date >= today)\
             .scalar() or 0
 
-        total_registered = db.session.query(db.func.count(ActiveSubscription.id))\
+        total_registered = read_session.query(db.func.count(ActiveSubscription.id))\
+            .join(User, ActiveSubscription.user_id == User.id).filter(User.deleted_at == None)\
             .filter(ActiveSubscription.type_id == st.id)\
             .scalar() or 0
 
@@ -498,10 +857,11 @@ def get_report_stats():
         })
 
     # --- Class stats ---
-    classes = ClassSchedule.query.order_by(ClassSchedule.day_of_week, ClassSchedule.start_time).all()
+    classes = read_session.query(ClassSchedule).order_by(ClassSchedule.day_of_week, ClassSchedule.start_time).all()
     class_stats = []
     for c in classes:
-        enrolled = db.session.query(db.func.count(ClassParticipant.id))\
+        enrolled = read_session.query(db.func.count(ClassParticipant.id))\
+            .join(User, ClassParticipant.user_id == User.id).filter(User.deleted_at == None)\
             .filter(ClassParticipant.class_id == c.id)\
             .scalar() or 0
 
@@ -525,11 +885,13 @@ def get_report_stats():
 
     # Unique clients = users with active subscription UNION users enrolled in any class
     active_sub_user_ids = set(
-        row[0] for row in db.session.query(ActiveSubscription.user_id)
+        row[0] for row in read_session.query(ActiveSubscription.user_id)
+        .join(User, ActiveSubscription.user_id == User.id).filter(User.deleted_at == None)
         .filter(ActiveSubscription.end_date >= today).all()
     )
     class_user_ids = set(
-        row[0] for row in db.session.query(ClassParticipant.user_id).all()
+        row[0] for row in read_session.query(ClassParticipant.user_id)
+        .join(User, ClassParticipant.user_id == User.id).filter(User.deleted_at == None).all()
     )
     total_unique_active = len(active_sub_user_ids | class_user_ids)
 
@@ -547,10 +909,11 @@ def get_report_stats():
 
 def get_subscription_stats():
     stats = []
-    sub_types = SubscriptionType.query.all()
+    sub_types = read_session.query(SubscriptionType).all()
     today = datetime.date.today()
     for st in sub_types:
-        count = db.session.query(db.func.count(ActiveSubscription.id))\
+        count = read_session.query(db.func.count(ActiveSubscription.id))\
+                .join(User, ActiveSubscription.user_id == User.id).filter(User.deleted_at == None)\
                 .filter(ActiveSubscription.type_id == st.id)\
                 .filter(ActiveSubscription.end_date >= today)\
                 .scalar()
@@ -559,10 +922,11 @@ def get_subscription_stats():
 
 def get_class_stats():
     stats = []
-    classes = ClassSchedule.query.order_by(ClassSchedule.day_of_week, ClassSchedule.start_time).all()
+    classes = read_session.query(ClassSchedule).order_by(ClassSchedule.day_of_week, ClassSchedule.start_time).all()
     days_map = ['Luni', 'Marți', 'Miercuri', 'Joi', 'Vineri', 'Sâmbătă', 'Duminică']
     for c in classes:
-        count = db.session.query(db.func.count(ClassParticipant.id))\
+        count = read_session.query(db.func.count(ClassParticipant.id))\
+                .join(User, ClassParticipant.user_id == User.id).filter(User.deleted_at == None)\
                 .filter(ClassParticipant.class_id == c.id)\
                 .scalar()
         
@@ -583,13 +947,13 @@ def get_class_stats():
 def get_user_stats(user_id):
     today = datetime.date.today()
     # Total visits
-    total_visits = db.session.query(db.func.count(AccessLog.id))\
+    total_visits = read_session.query(db.func.count(AccessLog.id))\
         .filter(AccessLog.user_id == user_id)\
         .filter(AccessLog.allowed == True)\
         .scalar()
         
     # Visits this month
-    monthly_visits = db.session.query(db.func.count(AccessLog.id))\
+    monthly_visits = read_session.query(db.func.count(AccessLog.id))\
         .filter(AccessLog.user_id == user_id)\
         .filter(AccessLog.allowed == True)\
         .filter(db.extract('year', AccessLog.timestamp) == today.year)\
@@ -601,25 +965,117 @@ def get_user_stats(user_id):
         'monthly_visits': monthly_visits
     }
 
+def get_recent_logs(limit=50):
+    rows = read_session.execute(
+        db.select(*RECENT_LOG_COLUMNS)
+        .join(User, AccessLog.user_id == User.id)
+        .where(User.deleted_at == None)
+        .order_by(AccessLog.timestamp.desc())
+        .limit(limit)
+    )
+    return [recent_log_row(row) for row in rows]
+
+def get_user_classes(user_id):
+    rows = read_session.execute(
+        db.select(*USER_CLASS_COLUMNS)
+        .join(ClassParticipant, ClassParticipant.class_id == ClassSchedule.id)
+        .where(ClassParticipant.user_id == user_id)
+    )
+    return [user_class_row(row) for row in rows]
+
 def get_user_logs(user_id, limit=100):
-    logs = AccessLog.query.filter_by(user_id=user_id)\
-        .order_by(AccessLog.timestamp.desc())\
-        .limit(limit).all()
-        
-    logs_list = []
-    for log in logs:
-        l_dict = dict_helper(log)
-        if hasattr(l_dict['timestamp'], 'strftime'):
-            l_dict['timestamp'] = l_dict['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
-        logs_list.append(l_dict)
-    return logs_list
+    rows = read_session.execute(
+        db.select(*LOG_COLUMNS)
+        .where(AccessLog.user_id == user_id)
+        .order_by(AccessLog.timestamp.desc())
+        .limit(limit)
+    )
+    return [log_row(row) for row in rows]
 
 def delete_access_log(log_id):
     try:
         AccessLog.query.filter_by(id=log_id).delete()
+        bump_cache_version('access_logs')
         db.session.commit()
         return True
     except Exception as e:
         print(f"Error deleting access log: {e}")
         db.session.rollback()
         return False
+
+def get_expiring_subscriptions(days=7, page=1, per_page=50):
+    # Range scan on ix_active_subscriptions_end_date, already in expiry order
+    today = datetime.date.today()
+    until = today + datetime.timedelta(days=days)
+
+    query = read_session.query(ActiveSubscription.id, ActiveSubscription.end_date, User.id, User.name, User.phone, SubscriptionType.name)\
+        .join(User, ActiveSubscription.user_id == User.id)\
+        .join(SubscriptionType, ActiveSubscription.type_id == SubscriptionType.id)\
+        .filter(User.deleted_at == None)\
+        .filter(ActiveSubscription.end_date >= today)\
+        .filter(ActiveSubscription.end_date <= until)\
+        .order_by(ActiveSubscription.end_date, ActiveSubscription.user_id)
+    paginated = query.paginate(page=page, per_page=per_page, error_out=False)
+
+    items = []
+    for sub_id, end_date, user_id, name, phone, sub_name in paginated.items:
+        items.append({
+            'subscription_id': sub_id,
+            'user_id': user_id,
+            'name': name,
+            'phone': phone,
+            'sub_name': sub_name,
+            'end_date': end_date.strftime('%Y-%m-%d'),
+            'days_left': (end_date - today).days,
+        })
+    return pagination_dict(paginated, items)
+
+def compute_renewal_candidates(days=7):
+    # Daily batch: members whose latest subscription ends within `days`
+    today = datetime.date.today()
+    until = today + datetime.timedelta(days=days)
+    later = db.aliased(ActiveSubscription)
+
+    renewed = db.session.query(later.id)\
+        .filter(later.user_id == ActiveSubscription.user_id)\
+        .filter(later.end_date > ActiveSubscription.end_date)\
+        .exists()
+    candidates = db.select(ActiveSubscription.user_id, ActiveSubscription.id, ActiveSubscription.end_date, db.literal(today))\
+        .where(ActiveSubscription.end_date >= today)\
+        .where(ActiveSubscription.end_date <= until)\
+        .where(~renewed)
+
+    try:
+        RenewalCandidate.query.delete()
+        result = db.session.execute(
+            db.insert(RenewalCandidate).from_select(['user_id', 'subscription_id', 'end_date', 'computed_on'], candidates)
+        )
+        bump_cache_version('renewal_candidates')
+        db.session.commit()
+        return result.rowcount
+    except Exception as e:
+        print(f"Error computing renewal candidates: {e}")
+        db.session.rollback()
+        return None
+
+def get_renewal_candidates_date():
+    return read_session.query(db.func.max(RenewalCandidate.computed_on)).scalar()
+
+def get_renewal_candidates(page=1, per_page=50):
+    today = datetime.date.today()
+    query = read_session.query(RenewalCandidate.end_date, User.id, User.name, User.phone)\
+        .join(User, RenewalCandidate.user_id == User.id)\
+        .filter(User.deleted_at == None)\
+        .order_by(RenewalCandidate.end_date, RenewalCandidate.user_id)
+    paginated = query.paginate(page=page, per_page=per_page, error_out=False)
+
+    items = []
+    for end_date, user_id, name, phone in paginated.items:
+        items.append({
+            'user_id': user_id,
+            'name': name,
+            'phone': phone,
+            'end_date': end_date.strftime('%Y-%m-%d'),
+            'days_left': (end_date - today).days,
+        })
+    return pagination_dict(paginated, items)
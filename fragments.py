@@ -0,0 +1,47 @@
+import threading
+from collections import OrderedDict
+
+from flask import render_template
+from flask_babel import get_locale
+from markupsafe import Markup
+
+# Rendered-fragment cache for list rows and cards (/users, /admin).
+# A fragment is keyed by template, locale, a key built from the entity id
+# and its version, and the row values it is rendered from. The mutation
+# functions in database.py invalidate it by bumping the version; the values
+# cover ids that SQLite hands out again after the highest row is deleted
+# (the tables have no AUTOINCREMENT). Stale entries age out of the LRU.
+
+MAX_FRAGMENTS = 5000
+
+_fragments = OrderedDict()
+_lock = threading.Lock()
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+def render_fragment(template, key, **context):
+    full_key = (template, str(get_locale()), key, _freeze(context))
+    with _lock:
+        html = _fragments.get(full_key)
+        if html is not None:
+            _fragments.move_to_end(full_key)
+            return html
+
+    html = Markup(render_template(template, **context))
+    with _lock:
+        _fragments[full_key] = html
+        if len(_fragments) > MAX_FRAGMENTS:
+            _fragments.popitem(last=False)
+    return html
+
+def clear_fragments():
+    with _lock:
+        _fragments.clear()
+
+def init_fragments(app):
+    app.jinja_env.globals['fragment'] = render_fragment
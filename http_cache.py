@@ -0,0 +1,92 @@
+import datetime
+import functools
+import gzip
+import hashlib
+import os
+
+from flask import request, make_response
+from flask_babel import get_locale
+
+import database
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# Response layer: ETags built from the data versions in database.py (so an
+# unchanged page is answered with 304 before any query runs) and gzip/brotli
+# for HTML and JSON. /static is left to Flask's own ETag/Last-Modified handling.
+
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_MIMETYPES = {'text/html', 'application/json', 'text/css', 'text/javascript', 'application/javascript'}
+
+_build_id = ''
+
+def _template_build_id(app):
+    # Changes whenever a template is redeployed, so old ETags stop matching
+    mtimes = []
+    for root, _, files in os.walk(app.template_folder):
+        mtimes.extend(os.path.getmtime(os.path.join(root, f)) for f in files)
+    return str(int(max(mtimes, default=0)))
+
+def conditional(*version_names):
+    # Weak ETag from the named cache versions plus locale and today's date
+    # (active/expiring subscriptions change at midnight without a write)
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(*args, **kwargs):
+            versions = database.get_cache_versions()
+            parts = [_build_id, str(get_locale()), datetime.date.today().isoformat()]
+            parts += [f"{name}={versions.get(name)}" for name in version_names]
+            etag = hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest()
+
+            if request.if_none_match.contains_weak(etag):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'no-cache'
+            response.vary.add('Cookie')  # locale lives in the session
+            return response
+        return wrapped
+    return decorator
+
+def _choose_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+def compress_response(response):
+    if (response.status_code != 200 or response.direct_passthrough
+            or response.mimetype not in COMPRESS_MIMETYPES
+            or 'Content-Encoding' in response.headers):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+
+    if encoding == 'br':
+        data = brotli.compress(data, quality=5)
+    else:
+        data = gzip.compress(data, compresslevel=6)
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+def init_http_cache(app):
+    global _build_id
+    _build_id = _template_build_id(app)
+
+    @app.after_request
+    def finish_response(response):
+        if request.endpoint == 'static':
+            return response
+        return compress_response(response)
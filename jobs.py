@@ -0,0 +1,69 @@
+import datetime
+import threading
+import time
+
+import backup
+import database
+
+# How often the scheduler wakes up to see if a daily job is due
+CHECK_INTERVAL_SECONDS = 15 * 60
+
+# Pause between purge batches so door scans can take the write lock
+PURGE_PAUSE_SECONDS = 0.05
+# How often an idle purge worker looks for jobs queued by other workers
+PURGE_POLL_SECONDS = 5
+
+_purge_wakeup = threading.Event()
+
+def run_renewal_candidates(app, days=7):
+    with app.app_context():
+        # Every gunicorn worker runs the scheduler; skip if someone already did today
+        if database.get_renewal_candidates_date() == datetime.date.today():
+            return
+        count = database.compute_renewal_candidates(days)
+        print(f"Renewal candidates computed: {count}")
+
+def run_scheduled_backup(app):
+    backup_dir = app.config['BACKUP_DIR']
+    if not backup.snapshot_due(backup_dir):
+        return
+    with app.app_context():
+        db_path = database.db.engine.url.database
+    snapshot = backup.take_snapshot(db_path, backup_dir)
+    if snapshot:
+        print(f"Backup snapshot written: {snapshot['name']} ({snapshot['seconds']}s)")
+
+def _daily_loop(app):
+    while True:
+        try:
+            run_renewal_candidates(app)
+        except Exception as e:
+            print(f"Error in daily jobs: {e}")
+        try:
+            run_scheduled_backup(app)
+        except Exception as e:
+            print(f"Error in scheduled backup: {e}")
+        time.sleep(CHECK_INTERVAL_SECONDS)
+
+def wake_purge_worker():
+    _purge_wakeup.set()
+
+def _purge_loop(app):
+    while True:
+        try:
+            with app.app_context():
+                while database.run_purge_step():
+                    time.sleep(PURGE_PAUSE_SECONDS)
+        except Exception as e:
+            print(f"Error in purge worker: {e}")
+        _purge_wakeup.wait(PURGE_POLL_SECONDS)
+        _purge_wakeup.clear()
+
+def start_background_jobs(app):
+    threads = [
+        threading.Thread(target=_daily_loop, args=(app,), name='daily-jobs', daemon=True),
+        threading.Thread(target=_purge_loop, args=(app,), name='purge-worker', daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+    return threads
@@ -0,0 +1,134 @@
+"""Replay captured traffic against a running instance.
+
+Usage:
+    python replay.py capture.jsonl --base-url http://127.0.0.1:5000 --speed 10 --concurrency 8
+
+Requests are sent with the same spacing as in the capture, divided by
+--speed (1 = real time, 10 = ten times faster, ...). At the end a table
+with latency percentiles and error rates per route is printed.
+Only run this against a local copy: POST requests are replayed as-is.
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Measure the route itself, not the page it redirects to
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+_opener = urllib.request.build_opener(_NoRedirect)
+
+def load_capture(path):
+    records = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    records.sort(key=lambda r: r['ts'])
+    return records
+
+def build_request(base_url, record):
+    url = base_url.rstrip('/') + record['path']
+    if record.get('query'):
+        url += '?' + record['query']
+    data = None
+    headers = {}
+    if record.get('body_type') == 'json':
+        data = json.dumps(record['body']).encode('utf-8')
+        headers['Content-Type'] = 'application/json'
+    elif record.get('body_type') == 'form':
+        data = urllib.parse.urlencode(record['body']).encode('utf-8')
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+    return urllib.request.Request(url, data=data, headers=headers, method=record['method'])
+
+def send(base_url, record, timeout):
+    req = build_request(base_url, record)
+    started = time.perf_counter()
+    try:
+        with _opener.open(req, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = None
+    return status, (time.perf_counter() - started) * 1000
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, int(round(pct / 100 * len(sorted_values))) - 1)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+def replay(records, base_url, speed=1.0, concurrency=4, timeout=30):
+    results = []
+    results_lock = threading.Lock()
+    max_lag = [0.0]
+
+    def run(record, scheduled):
+        lag = time.perf_counter() - scheduled
+        status, latency = send(base_url, record, timeout)
+        route = record.get('route') or record['path']
+        with results_lock:
+            results.append((f"{record['method']} {route}", status, latency))
+            max_lag[0] = max(max_lag[0], lag)
+
+    if not records:
+        return results, 0.0, 0.0
+
+    first_ts = records[0]['ts']
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for record in records:
+            scheduled = started + (record['ts'] - first_ts) / speed
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(run, record, scheduled)
+    elapsed = time.perf_counter() - started
+    return results, elapsed, max_lag[0] * 1000
+
+def report(results, elapsed, max_lag_ms):
+    by_route = {}
+    for route, status, latency in results:
+        by_route.setdefault(route, []).append((status, latency))
+
+    header = f"{'route':40s} {'count':>6s} {'err%':>6s} {'4xx':>5s} {'p50':>8s} {'p90':>8s} {'p99':>8s} {'max':>8s}"
+    print(header)
+    print('-' * len(header))
+    for route in sorted(by_route):
+        rows = by_route[route]
+        latencies = sorted(latency for _, latency in rows)
+        errors = sum(1 for status, _ in rows if status is None or status >= 500)
+        client_errors = sum(1 for status, _ in rows if status is not None and 400 <= status < 500)
+        print(f"{route[:40]:40s} {len(rows):6d} {errors / len(rows) * 100:6.1f} {client_errors:5d} "
+              f"{percentile(latencies, 50):8.1f} {percentile(latencies, 90):8.1f} "
+              f"{percentile(latencies, 99):8.1f} {latencies[-1]:8.1f}")
+
+    total = len(results)
+    rate = total / elapsed if elapsed else 0.0
+    print(f"\n{total} requests in {elapsed:.1f}s ({rate:.1f} req/s), latencies in ms, "
+          f"max schedule lag {max_lag_ms:.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay captured traffic and report latency per route.')
+    parser.add_argument('capture', help='JSONL file written in capture mode (ACCESS_CONTROL_CAPTURE)')
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--speed', type=float, default=1.0, help='1 = real time, 10 = 10x faster, ...')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--timeout', type=float, default=30)
+    args = parser.parse_args()
+
+    records = load_capture(args.capture)
+    results, elapsed, max_lag_ms = replay(records, args.base_url, args.speed, args.concurrency, args.timeout)
+    report(results, elapsed, max_lag_ms)
+
+if __name__ == '__main__':
+    main()
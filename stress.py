@@ -0,0 +1,179 @@
+"""Concurrency checks against a running instance.
+
+Usage:
+    python stress.py reports --base-url http://127.0.0.1:5000 --type-id 5 --seconds 10 --readers 1
+    python stress.py admissions --base-url http://127.0.0.1:5000 --type-id 4 --limit 3 --threads 40
+
+reports: scans one card at a steady rate, first alone and then while
+--readers threads fetch /reports in a loop, and prints scan latency
+percentiles for both phases. With reads on the read-only pool, scan p99
+should stay about the same. Keep --readers below the number of spare CPU
+cores: once the CPU is saturated, scans wait for the CPU rather than the
+database, and the comparison no longer says anything about the pools.
+
+admissions: registers a member on a subscription limited to --limit
+entries per week and fires --threads scans of that card at the same
+moment. Exactly --limit must be allowed; the exit code is 1 otherwise.
+Run it against several gunicorn workers to cover cross-process races.
+
+A new member is registered for the run (--type-id picks the subscription),
+or pass --rfid to scan an existing card. Only run this against a local
+copy of the database: every scan is logged.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+from replay import percentile
+
+def post_form(base_url, path, fields, timeout=30):
+    data = urllib.parse.urlencode(fields).encode('utf-8')
+    req = urllib.request.Request(base_url.rstrip('/') + path, data=data, method='POST')
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        return response.status
+
+def register_member(base_url, type_id):
+    tag = 'STRESS-' + uuid.uuid4().hex[:10].upper()
+    post_form(base_url, '/register', {
+        'name': f'Stress {tag[-4:]}',
+        'phone': '09' + str(uuid.uuid4().int)[:8],
+        'rfid_tag': tag,
+        'subscription_type': type_id,
+    })
+    return tag
+
+def scan(base_url, rfid_tag, timeout=30):
+    # Returns (scan status or None on error, latency in ms)
+    data = json.dumps({'rfid_tag': rfid_tag}).encode('utf-8')
+    req = urllib.request.Request(base_url.rstrip('/') + '/api/scan', data=data,
+                                 headers={'Content-Type': 'application/json'}, method='POST')
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            status = json.loads(response.read()).get('status')
+    except (urllib.error.URLError, OSError, ValueError):
+        status = None
+    return status, (time.perf_counter() - started) * 1000
+
+def fetch(base_url, path, timeout=30):
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(base_url.rstrip('/') + path, timeout=timeout) as response:
+            response.read()
+            ok = True
+    except (urllib.error.URLError, OSError):
+        ok = False
+    return ok, (time.perf_counter() - started) * 1000
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    if not latencies:
+        return 'no samples'
+    return (f"n={len(latencies)} p50 {percentile(latencies, 50):.1f} "
+            f"p99 {percentile(latencies, 99):.1f} max {latencies[-1]:.1f} ms")
+
+def scan_loop(base_url, rfid_tag, seconds, interval):
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        status, latency = scan(base_url, rfid_tag)
+        if status is None:
+            errors += 1
+        latencies.append(latency)
+        time.sleep(interval)
+    return latencies, errors
+
+def run_reports(args):
+    rfid_tag = args.rfid or register_member(args.base_url, args.type_id)
+
+    baseline, baseline_errors = scan_loop(args.base_url, rfid_tag, args.seconds, args.interval)
+
+    stop = threading.Event()
+    report_latencies = []
+    lock = threading.Lock()
+
+    def reader():
+        while not stop.is_set():
+            ok, latency = fetch(args.base_url, '/reports')
+            with lock:
+                report_latencies.append(latency if ok else None)
+
+    readers = [threading.Thread(target=reader, daemon=True) for _ in range(args.readers)]
+    for thread in readers:
+        thread.start()
+    loaded, loaded_errors = scan_loop(args.base_url, rfid_tag, args.seconds, args.interval)
+    stop.set()
+    for thread in readers:
+        thread.join()
+
+    report_ok = [latency for latency in report_latencies if latency is not None]
+    print(f"card {rfid_tag}, {args.seconds:g}s per phase, one scan every {args.interval * 1000:.0f} ms")
+    print(f"scans alone:            {summarize(baseline)}, errors {baseline_errors}")
+    print(f"scans + {args.readers} /reports loops: {summarize(loaded)}, errors {loaded_errors}")
+    print(f"/reports:               {summarize(report_ok)}, errors {len(report_latencies) - len(report_ok)}")
+    if baseline and loaded:
+        ratio = percentile(sorted(loaded), 99) / max(percentile(sorted(baseline), 99), 0.001)
+        print(f"scan p99 under load / alone: {ratio:.2f}x")
+    return 1 if baseline_errors or loaded_errors else 0
+
+def run_admissions(args):
+    rfid_tag = register_member(args.base_url, args.type_id)
+    start = threading.Barrier(args.threads)
+
+    def scan_together(_):
+        start.wait()
+        return scan(args.base_url, rfid_tag)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        results = list(pool.map(scan_together, range(args.threads)))
+    elapsed = time.perf_counter() - started
+
+    allowed = sum(1 for status, _ in results if status == 'allowed')
+    denied = sum(1 for status, _ in results if status == 'denied')
+    errors = sum(1 for status, _ in results if status is None)
+    print(f"card {rfid_tag}, {args.threads} simultaneous scans, limit {args.limit}/week")
+    print(f"allowed {allowed}, denied {denied}, errors {errors}")
+    print(f"latency {summarize([latency for _, latency in results])}, "
+          f"{len(results) / elapsed:.1f} scans/s")
+    if allowed != args.limit or errors:
+        print(f"FAIL: expected exactly {args.limit} allowed")
+        return 1
+    print('OK: no over-admissions')
+    return 0
+
+def main():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--base-url', default='http://127.0.0.1:5000')
+    parser = argparse.ArgumentParser(description='Concurrency checks against a running instance.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    reports = commands.add_parser('reports', parents=[common], help='scan latency with and without a /reports loop')
+    reports.add_argument('--rfid', help='existing card to scan (default: register a new member)')
+    reports.add_argument('--type-id', help='subscription type for the new member (use an unlimited one)')
+    reports.add_argument('--seconds', type=float, default=10)
+    reports.add_argument('--interval', type=float, default=0.05, help='pause between scans, seconds')
+    reports.add_argument('--readers', type=int, default=1)
+
+    admissions = commands.add_parser('admissions', parents=[common], help='simultaneous scans of one limited card')
+    admissions.add_argument('--type-id', required=True, help='subscription type with an entries_per_week limit')
+    admissions.add_argument('--limit', type=int, required=True, help="that type's entries_per_week")
+    admissions.add_argument('--threads', type=int, default=40)
+
+    args = parser.parse_args()
+    if args.command == 'admissions':
+        return run_admissions(args)
+    if args.command == 'reports':
+        if not args.rfid and not args.type_id:
+            parser.error('reports needs --rfid or --type-id')
+        return run_reports(args)
+
+if __name__ == '__main__':
+    raise SystemExit(main())
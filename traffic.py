@@ -0,0 +1,56 @@
+import json
+import os
+import threading
+import time
+
+from flask import g, request
+
+# Capture mode: every request is appended to a JSONL file with its timing,
+# so real sequences (scans, admin views, registrations) can be replayed
+# later with replay.py. Enabled by setting ACCESS_CONTROL_CAPTURE to a path.
+
+_write_lock = threading.Lock()
+
+def _request_body():
+    if request.is_json:
+        return 'json', request.get_json(silent=True)
+    if request.form:
+        return 'form', request.form.to_dict(flat=True)
+    return None, None
+
+def init_capture(app, path):
+    if not path:
+        return
+
+    @app.before_request
+    def start_capture_timer():
+        # Wall clock for replay scheduling, perf_counter for the duration
+        g.capture_arrived = time.time()
+        g.capture_started = time.perf_counter()
+
+    @app.after_request
+    def capture_request(response):
+        if request.path.startswith('/static'):
+            return response
+        started = g.get('capture_started')
+        body_type, body = _request_body()
+        record = {
+            'ts': g.get('capture_arrived', time.time()),
+            'method': request.method,
+            'path': request.path,
+            'query': request.query_string.decode('utf-8', 'replace'),
+            'route': request.url_rule.rule if request.url_rule else None,
+            'body_type': body_type,
+            'body': body,
+            'status': response.status_code,
+            'duration_ms': round((time.perf_counter() - started) * 1000, 2) if started else None,
+        }
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        # O_APPEND keeps lines from several gunicorn workers intact
+        with _write_lock:
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line.encode('utf-8'))
+            finally:
+                os.close(fd)
+        return response